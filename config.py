@@ -43,6 +43,7 @@ class BentoConfig:
             self.dataset = None
             self.no_parents = None
             self.split_transactions = None
+            self.batch_size = None
             self.upload_log_dir = None
             self.verbose = None
             self.database_type = "neo4j"
@@ -54,14 +55,10 @@ class BentoConfig:
                     config = yaml.safe_load(c_file)['Config']
 
                     #################################
-                    # Folders
+                    # Folders, created when they are used, not here, since they can be overridden by arguments and
+                    # backup folder can be on a remote Neo4j server
                     self.temp_folder = config.get('temp_folder')
-                    if self.temp_folder:
-                        self._create_folder(self.temp_folder)
-
                     self.backup_folder = config.get('backup_folder')
-                    if self.backup_folder:
-                        self._create_folder(self.backup_folder)
 
                     #################################
                     # File-loader related
@@ -106,6 +103,7 @@ class BentoConfig:
                     self.dataset = config.get('dataset')
                     self.no_parents = config.get('no_parents')
                     self.split_transactions = config.get('split_transactions')
+                    self.batch_size = config.get('batch_size')
                     self.upload_log_dir = config.get('upload_log_dir')
                     self.verbose = config.get('verbose')
                     self.database_type = config.get("database_type")
@@ -114,10 +112,3 @@ class BentoConfig:
                 msg = f'Can NOT open configuration file "{config_file}"!'
                 self.log.error(msg)
                 raise Exception(msg)
-
-    def _create_folder(self, folder):
-        os.makedirs(folder, exist_ok=True)
-        if not os.path.isdir(folder):
-            msg = f'{folder} is not a folder!'
-            self.log.error(msg)
-            raise Exception(msg)
@@ -1,3 +1,5 @@
+from bento.common.utils import UUID
+
 NEO4J = "neo4j"
 MEMGRAPH = "memgraph"
 def format_as_tuple(node_name, properties):
@@ -50,7 +52,7 @@ def get_btree_indexes(session):
 def create_indexes(session, schema, log, database_type):
     """
     Creates indexes, if they do not already exist, for all entries in the "id_fields" and "indexes" sections of the
-    properties file
+    properties file, and on uuid for all other node types
     :param session: the current neo4j transaction session
     """
     index_created = 0
@@ -63,6 +65,14 @@ def create_indexes(session, schema, log, database_type):
             index_created = create_neo4j_index(node_name, ids[node_name], existing, session, log, index_created)
         elif database_type == MEMGRAPH:
             index_created = create_memgraph_index(node_name, ids[node_name], session, log, index_created)
+    # Nodes without an id field are loaded by matching on uuid, create indexes for them too
+    for node_name in schema.get_node_names():
+        if node_name in ids or node_name in schema.relationship_props:
+            continue
+        if database_type == NEO4J:
+            index_created = create_neo4j_index(node_name, UUID, existing, session, log, index_created)
+        elif database_type == MEMGRAPH:
+            index_created = create_memgraph_index(node_name, UUID, session, log, index_created)
     # Create indexes from "indexes" section of the properties file
     indexes = schema.props.indexes
     # each index is a dictionary, indexes is a list of these dictionaries
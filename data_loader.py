@@ -3,21 +3,25 @@
 import os
 from collections import deque
 import csv
+from contextlib import contextmanager
 import re
 import datetime
 import sys
 import platform
+import queue
+import shlex
 import subprocess
+import threading
 import json
 import pandas as pd
 import datetime
-import mgclient
 from timeit import default_timer as timer
 from bento.common.utils import get_host, DATETIME_FORMAT, reformat_date, get_time_stamp
 from memgraph_backup_restore import backup_memgraph_mgconsole
 from create_index import create_index, NEO4J, MEMGRAPH
 
 from neo4j import Driver
+from neo4j.exceptions import CypherSyntaxError
 
 from icdc_schema import ICDC_Schema, is_parent_pointer
 from bento.common.utils import get_logger, NODES_CREATED, RELATIONSHIP_CREATED, UUID, \
@@ -40,7 +44,12 @@ INT_NODE_CREATED = 'int_node_created'
 PROVIDED_PARENTS = 'provided_parents'
 RELATIONSHIP_PROPS = 'relationship_properties'
 BATCH_SIZE = 1000
+WIPE_BATCH_SIZE = 50000
+BATCH_ROWS = 'rows'
+UNWIND_ROWS = 'UNWIND ${} AS row'.format(BATCH_ROWS)
 OTHER = '__other__'
+BOOLEAN_TRUE_SEARCH = re.compile(r'yes|true', re.IGNORECASE)
+BOOLEAN_FALSE_SEARCH = re.compile(r'no|false', re.IGNORECASE)
 csv.field_size_limit(sys.maxsize)
 
 def format_as_tuple(node_name, properties):
@@ -58,48 +67,44 @@ def format_as_tuple(node_name, properties):
 
 def backup_neo4j(backup_dir, name, address, log):
     try:
-        restore_cmd = 'To restore DB from backup (to remove any changes caused by current data loading, run ' \
-                      'following commands:\n '
-        restore_cmd += '#' * 160 + '\n'
+        separator = '#' * 160
+        restore_lines = ['To restore DB from backup (to remove any changes caused by current data loading, run '
+                         'following commands:', ' ' + separator]
         neo4j_cmd = 'neo4j-admin restore --from={}/{} --force'.format(backup_dir, name)
-        mkdir_cmd = [
-            'mkdir',
-            '-p',
-            backup_dir
-        ]
-        is_shell = False
-        # settings for Windows platforms
-        if platform.system() == "Windows":
-            mkdir_cmd[2] = os.path.abspath(backup_dir)
-            is_shell = True
-        cmds = [
-            mkdir_cmd,
-            [
-                'neo4j-admin',
-                'backup',
-                '--backup-dir={}'.format(backup_dir)
-            ]
+        backup_cmd = [
+            'neo4j-admin',
+            'backup',
+            '--backup-dir={}'.format(backup_dir)
         ]
         if address in ['localhost', '127.0.0.1']:
+            is_shell = False
             # On Windows, the Neo4j service cannot be accessed through the command line without an absolute path
             # or a custom installation location
             if platform.system() == "Windows":
-                restore_cmd += '\tManually stop the Neo4j service\n\t$ {}\n\tManually start the Neo4j service\n'.format(
-                    neo4j_cmd)
+                restore_lines += ['\tManually stop the Neo4j service', f'\t$ {neo4j_cmd}',
+                                  '\tManually start the Neo4j service']
+                is_shell = True
             else:
-                restore_cmd += '\t$ neo4j stop && {} && neo4j start\n'.format(neo4j_cmd)
-            for cmd in cmds:
-                log.info(cmd)
-                subprocess.call(cmd, shell=is_shell)
+                restore_lines.append(f'\t$ neo4j stop && {neo4j_cmd} && neo4j start')
+            # Not "mkdir -p", on Windows it fails if the folder exists
+            os.makedirs(backup_dir, exist_ok=True)
+            log.info(backup_cmd)
+            subprocess.run(backup_cmd, shell=is_shell, check=True)
         else:
             second_cmd = 'sudo systemctl stop neo4j && {} && sudo systemctl start neo4j && exit'.format(neo4j_cmd)
-            restore_cmd += '\t$ echo "{}" | ssh -t {} sudo su - neo4j\n'.format(second_cmd, address)
-            for cmd in cmds:
-                remote_cmd = ['ssh', address, '-o', 'StrictHostKeyChecking=no'] + cmd
-                log.info(' '.join(remote_cmd))
-                subprocess.call(remote_cmd)
-        restore_cmd += '#' * 160
-        return restore_cmd
+            restore_lines.append(f'\t$ echo "{second_cmd}" | ssh -t {address} sudo su - neo4j')
+            mkdir_cmd = [
+                'mkdir',
+                '-p',
+                backup_dir
+            ]
+            # Run all commands through one SSH connection
+            remote_cmd = ['ssh', address, '-o', 'StrictHostKeyChecking=no',
+                          ' && '.join(shlex.join(cmd) for cmd in [mkdir_cmd, backup_cmd])]
+            log.info(' '.join(remote_cmd))
+            subprocess.run(remote_cmd, check=True)
+        restore_lines.append(separator)
+        return '\n'.join(restore_lines)
     except Exception as e:
         log.exception(e)
         return False
@@ -117,6 +122,113 @@ def check_encoding(file_name):
         return windows1252
 
 
+def read_ahead(iterable, max_size):
+    """
+    Iterate given iterable in a background thread, so items are produced while previous items are being consumed
+    :param iterable: iterable to read from
+    :param max_size: max number of items to read ahead
+    :return: a generator yields same items as given iterable, exceptions raised by iterable are re-raised
+    """
+    items = queue.Queue(max_size)
+    stopped = threading.Event()
+    end = object()
+
+    def put(entry):
+        while not stopped.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((end, None))
+        except BaseException as e:
+            put((end, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is end:
+                if error:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+@contextmanager
+def open_tsv(file_name):
+    """
+    Open a TSV file with detected encoding
+    Rows are parsed by csv.DictReader: missing cells are None, extra cells are put in a list under key None, and the
+    last column wins if a header is repeated, cleanup_node() and validations rely on these
+    :param file_name: data file name
+    :return: a context manager gives an iterator of rows, each row is a dict
+    """
+    file_encoding = check_encoding(file_name)
+    with open(file_name, encoding=file_encoding) as in_file:
+        yield csv.DictReader(in_file, delimiter='\t')
+
+
+class BatchedTransaction:
+    """
+    Explicit transaction used in split-transactions mode, shared by all data files in a load, so each file doesn't end
+    with its own (usually small) commit. Statements are run in current transaction, commit() commits it and starts
+    the next one
+    """
+    def __init__(self, session, batch_size):
+        self.session = session
+        self.batch_size = batch_size
+        # rows in current transaction
+        self.rows = 0
+        # rows in all committed transactions
+        self.committed = 0
+        self.tx = session.begin_transaction()
+
+    def run(self, *args, **kwargs):
+        return self.tx.run(*args, **kwargs)
+
+    def add_row(self):
+        """
+        Count one processed row
+        :return: True if batch size is reached and transaction should be committed
+        """
+        self.rows += 1
+        return self.rows >= self.batch_size
+
+    def commit(self):
+        self.tx.commit()
+        self.tx = self.session.begin_transaction()
+        self.committed += self.rows
+        self.rows = 0
+
+    def close(self):
+        self.tx.commit()
+        self.committed += self.rows
+        self.rows = 0
+
+
+def current_transaction(tx):
+    """
+    Get the Neo4j session or transaction statements are currently run in, plugins check its type, so they must not be
+    given a BatchedTransaction
+    :param tx: Neo4j session or transaction, or a BatchedTransaction
+    :return: Neo4j session or transaction
+    """
+    if isinstance(tx, BatchedTransaction):
+        return tx.tx
+    return tx
+
+
 # Mask all relationship properties, so they won't participate in property comparison
 def get_props_signature(props):
     clean_props = props
@@ -136,9 +248,19 @@ class DataLoader:
         self.log = get_logger('Data Loader')
         self.driver = driver
         self.database_type = NEO4J
+        self.batch_size = BATCH_SIZE
         if config is not None:
             self.database_type = config.database_type
+            batch_size = getattr(config, 'batch_size', None)
+            if batch_size is not None:
+                if isinstance(batch_size, bool) or not isinstance(batch_size, int) or batch_size <= 0:
+                    msg = f'Invalid batch_size "{batch_size}", it must be a positive integer!'
+                    self.log.error(msg)
+                    raise Exception(msg)
+                self.batch_size = batch_size
             if config.database_type == MEMGRAPH:
+                # Only needed for Memgraph, import here so Neo4j runs don't load the C extension
+                import mgclient
                 mg_uri_list = config.neo4j_uri.replace("bolt://", "").split(":")
                 mg_host = mg_uri_list[0]
                 mg_port = int(mg_uri_list[1])
@@ -178,6 +300,8 @@ class DataLoader:
         self.df_validation_dict = {}
         self.skip_validation_flag = False
         self.cheat_mode = True
+        # (node type, column) -> (is parent pointer, is relationship property, property type)
+        self.column_info = {}
 
     def check_files(self, file_list):
         if not file_list:
@@ -195,9 +319,7 @@ class DataLoader:
         try:
             with self.driver.session() as session:
                 for txt in file_list:
-                    file_encoding = check_encoding(txt)
-                    with open(txt, encoding=file_encoding) as in_file:
-                        reader = csv.DictReader(in_file, delimiter='\t')
+                    with open_tsv(txt) as reader:
                         line_number = 1
                         for org_obj in reader:
                             line_number += 1
@@ -368,11 +490,16 @@ class DataLoader:
     def _load_all(self, tx, file_list, loading_mode, split, wipe_db):
         if wipe_db:
             self.wipe_db(tx, split)
+        if split:
+            # One transaction carried across all files, committed every batch_size rows
+            tx = BatchedTransaction(tx, self.batch_size)
         for txt in file_list:
             self.load_nodes(tx, txt, loading_mode, split)
         if loading_mode != DELETE_MODE:
             for txt in file_list:
                 self.load_relationships(tx, txt, loading_mode, split)
+        if split:
+            tx.close()
 
     # Remove extra spaces at beginning and end of the keys and values
     @staticmethod
@@ -388,25 +515,18 @@ class DataLoader:
         node_type = obj.get(NODE_TYPE, None)
         # Cleanup values for Boolean, Int and Float types
         if node_type:
-            df_validation_result = pd.DataFrame(columns=['File Name', 'Property', 'Value', 'Reason', 'Line Numbers', 'Severity'])
+            df_validation_result = None
             for key, value in obj.items():
-                search_node_type = node_type
-                search_key = key
-                if is_parent_pointer(key):
-                    search_node_type, search_key = key.split('.')
-                elif self.schema.is_relationship_property(key):
-                    search_node_type, search_key = key.split(self.rel_prop_delimiter)
-
-                key_type = self.schema.get_prop_type(search_node_type, search_key)
+                _, _, key_type = self.get_column_info(node_type, key)
                 if key_type == 'Boolean':
                     cleaned_value = None
                     if isinstance(value, str):
-                        if re.search(r'yes|true', value, re.IGNORECASE):
+                        if BOOLEAN_TRUE_SEARCH.search(value):
                             cleaned_value = True
-                        elif re.search(r'no|false', value, re.IGNORECASE):
+                        elif BOOLEAN_FALSE_SEARCH.search(value):
                             cleaned_value = False
                         else:
-                            self.log.debug('Unsupported Boolean value: "{}"'.format(value))
+                            self.log.debug('Unsupported Boolean value: "%s"', value)
                             cleaned_value = None
                     obj[key] = cleaned_value
                 elif key_type == 'Int':
@@ -441,10 +561,12 @@ class DataLoader:
             for key, value in obj.items():
                 obj2[key] = value
                 # Add parent id field(s) into node
-                if obj[NODE_TYPE] in self.schema.props.save_parent_id and is_parent_pointer(key):
+                if obj[NODE_TYPE] in self.schema.props.save_parent_id and self.get_column_info(node_type, key)[0]:
                     header = key.split('.')
                     if len(header) > 2:
                         self.log.warning('Column header "{}" has multiple periods!'.format(key))
+                        if df_validation_result is None:
+                            df_validation_result = pd.DataFrame(columns=['File Name', 'Property', 'Value', 'Reason', 'Line Numbers', 'Severity'])
                         df_validation_result = self.update_field_validation_result(df_validation_result, file_name, "", "column_header_has_multiple_periods", "warning")
                         if obj[NODE_TYPE] not in self.df_validation_dict.keys():
                             self.df_validation_dict[obj[NODE_TYPE]] = df_validation_result
@@ -454,9 +576,8 @@ class DataLoader:
                     parent = header[0]
                     combined = '{}_{}'.format(parent, field_name)
                     if field_name in obj:
-                        self.log.debug(
-                            '"{}" field is in both current node and parent "{}", use {} instead !'.format(key, parent,
-                                                                                                        combined))
+                        self.log.debug('"%s" field is in both current node and parent "%s", use %s instead !', key,
+                                       parent, combined)
                         field_name = combined
                     # Add an value for parent id
                     obj2[field_name] = value
@@ -491,6 +612,41 @@ class DataLoader:
             self.log.error('No "type" column in file, abort loading')
             sys.exit(1)
 
+    def get_column_info(self, node_type, key):
+        """
+        Look up how a column is handled for given node type, results are cached since all rows in a file share the
+        same columns
+        :param node_type: node type of the row
+        :param key: column name
+        :return: a tuple of (is parent pointer, is relationship property, property type)
+        """
+        cache_key = (node_type, key)
+        info = self.column_info.get(cache_key)
+        if info is None:
+            parent_pointer = is_parent_pointer(key)
+            relationship_property = not parent_pointer and bool(self.schema.is_relationship_property(key))
+            search_node_type = node_type
+            search_key = key
+            if parent_pointer:
+                search_node_type, search_key = key.split('.')
+            elif relationship_property:
+                search_node_type, search_key = key.split(self.rel_prop_delimiter)
+            info = (parent_pointer, relationship_property, self.schema.get_prop_type(search_node_type, search_key))
+            self.column_info[cache_key] = info
+        return info
+
+    def read_prepared_nodes(self, file_name):
+        """
+        Read a data (TSV/TXT) file and prepare each row for loading
+        :param file_name: data file name
+        :return: a generator yields line number and prepared object of each row
+        """
+        with open_tsv(file_name) as reader:
+            line_num = 1
+            for org_obj in reader:
+                line_num += 1
+                yield line_num, self.prepare_node(org_obj, file_name)
+
     def get_signature(self, node):
         result = []
         for key in sorted(node.keys()):
@@ -505,10 +661,8 @@ class DataLoader:
             self.log.error('Invalid Neo4j Python Driver!')
             return False
         with self.driver.session() as session:
-            file_encoding = check_encoding(file_name)
-            with open(file_name, encoding=file_encoding) as in_file:
+            with open_tsv(file_name) as reader:
                 self.log.info('Validating relationships in file "{}" ...'.format(file_name))
-                reader = csv.DictReader(in_file, delimiter='\t')
                 line_num = 1
                 validation_failed = False
                 violations = 0
@@ -534,10 +688,8 @@ class DataLoader:
             self.log.error('Invalid Neo4j Python Driver!')
             return False
         with self.driver.session() as session:
-            file_encoding = check_encoding(file_name)
-            with open(file_name, encoding=file_encoding) as in_file:
+            with open_tsv(file_name) as reader:
                 self.log.info('Validating relationships in file "{}" ...'.format(file_name))
-                reader = csv.DictReader(in_file, delimiter='\t')
                 line_num = 1
                 validation_failed = False
                 violations = 0
@@ -566,11 +718,13 @@ class DataLoader:
         :return: an object (dict) that only contains properties on this node
         """
         node = {}
+        node_type = obj.get(NODE_TYPE)
 
         for key, value in obj.items():
-            if is_parent_pointer(key):
+            parent_pointer, relationship_property, _ = self.get_column_info(node_type, key)
+            if parent_pointer:
                 continue
-            elif self.schema.is_relationship_property(key):
+            elif relationship_property:
                 continue
             else:
                 node[key] = value
@@ -580,9 +734,7 @@ class DataLoader:
     # Validate the field names
     def validate_field_name(self, file_name):
         df_validation_result = pd.DataFrame(columns=['File Name', 'Property', 'Value', 'Reason', 'Line Numbers', 'Severity'])
-        file_encoding = check_encoding(file_name)
-        with open(file_name, encoding=file_encoding) as in_file:
-            reader = csv.DictReader(in_file, delimiter='\t')
+        with open_tsv(file_name) as reader:
             row = next(reader)
             row = self.cleanup_node(row)
             row_prepare_node = self.prepare_node(row, file_name)
@@ -640,10 +792,8 @@ class DataLoader:
     # Validate file
     def validate_file(self, file_name, max_violations, verbose):
         self.skip_validation_flag = False
-        file_encoding = check_encoding(file_name)
-        with open(file_name, encoding=file_encoding) as in_file:
+        with open_tsv(file_name) as reader:
             self.log.info('Validating file "{}" ...'.format(file_name))
-            reader = csv.DictReader(in_file, delimiter='\t')
             line_num = 1
             validation_failed = False
             violations = 0
@@ -788,7 +938,7 @@ class DataLoader:
             return line_num_list
 
     def get_new_statement(self, node_type, obj):
-        # statement is used to create current node
+        # statement is used to create a batch of nodes, each row in $rows is a node
         prop_stmts = []
 
         for key in obj.keys():
@@ -799,13 +949,13 @@ class DataLoader:
             elif self.schema.is_relationship_property(key):
                 continue
 
-            prop_stmts.append('{0}: ${0}'.format(key))
+            prop_stmts.append('{0}: row.{0}'.format(key))
 
-        statement = 'CREATE (:{0} {{ {1} }})'.format(node_type, ' ,'.join(prop_stmts))
+        statement = '{0} CREATE (:{1} {{ {2} }})'.format(UNWIND_ROWS, node_type, ' ,'.join(prop_stmts))
         return statement
 
     def get_upsert_statement(self, node_type, id_field, obj):
-        # statement is used to create current node
+        # statement is used to create or update a batch of nodes, each row in $rows is a node
         statement = ''
         prop_stmts = []
 
@@ -819,11 +969,11 @@ class DataLoader:
             elif self.schema.is_relationship_property(key):
                 continue
 
-            prop_stmts.append('n.{0} = ${0}'.format(key))
+            prop_stmts.append('n.{0} = row.{0}'.format(key))
 
-        statement += 'MERGE (n:{0} {{ {1}: ${1} }})'.format(node_type, id_field)
-        statement += ' ON CREATE ' + 'SET n.{} = datetime(), '.format(CREATED) + ' ,'.join(prop_stmts)
-        statement += ' ON MATCH ' + 'SET n.{} = datetime(), '.format(UPDATED) + ' ,'.join(prop_stmts)
+        statement += '{0} MERGE (n:{1} {{ {2}: row.{2} }})'.format(UNWIND_ROWS, node_type, id_field)
+        statement += ' ON CREATE SET ' + ' ,'.join(['n.{} = datetime()'.format(CREATED)] + prop_stmts)
+        statement += ' ON MATCH SET ' + ' ,'.join(['n.{} = datetime()'.format(UPDATED)] + prop_stmts)
         return statement
 
     # Delete a node and children with no other parents recursively
@@ -884,78 +1034,108 @@ class DataLoader:
             raise Exception('Wrong loading_mode: {}'.format(loading_mode))
         self.log.info('{} nodes from file: {}'.format(action_word, file_name))
 
-        file_encoding = check_encoding(file_name)
-        with open(file_name, encoding=file_encoding) as in_file:
-            reader = csv.DictReader(in_file, delimiter='\t')
-            nodes_created = 0
-            nodes_updated = 0
-            nodes_deleted = 0
-            node_type = 'UNKNOWN'
-            relationship_deleted = 0
-            line_num = 1
-            transaction_counter = 0
-
-            # Use session in one transaction mode
-            tx = session
-            # Use transactions in split-transactions mode
-            if split:
-                tx = session.begin_transaction()
-
-            for org_obj in reader:
-                line_num += 1
-                transaction_counter += 1
-                obj = self.prepare_node(org_obj, file_name)
-                node_type = obj[NODE_TYPE]
-                node_id = self.schema.get_id(obj)
-                if not node_id:
-                    raise Exception('Line:{}: No ids found!'.format(line_num))
-                id_field = self.schema.get_id_field(obj)
-                if loading_mode == UPSERT_MODE:
-                    statement = self.get_upsert_statement(node_type, id_field, obj)
-                elif loading_mode == NEW_MODE:
-                    if self.node_exists(tx, node_type, id_field, node_id):
-                        raise Exception(
-                            'Line: {}: Node (:{} {{ {}: {} }}) exists! Abort loading!'.format(line_num, node_type,
-                                                                                              id_field, node_id))
-                    else:
-                        statement = self.get_new_statement(node_type, obj)
-                elif loading_mode == DELETE_MODE:
-                    n_deleted, r_deleted = self.delete_node(tx, obj)
-                    nodes_deleted += n_deleted
-                    relationship_deleted += r_deleted
+        nodes_created = 0
+        nodes_updated = 0
+        nodes_deleted = 0
+        node_type = 'UNKNOWN'
+        relationship_deleted = 0
+        line_num = 1
+        statements = {}
+        # Rows sharing the same statement are sent to the database together with UNWIND
+        statement = None
+        batch_node_type = None
+        batch = []
+        batch_ids = set()
+
+        # Session is the transaction in one transaction mode, or a BatchedTransaction in split-transactions mode
+        tx = session
+
+        for line_num, obj in read_ahead(self.read_prepared_nodes(file_name), self.batch_size):
+            node_type = obj[NODE_TYPE]
+            node_id = self.schema.get_id(obj)
+            if not node_id:
+                raise Exception('Line:{}: No ids found!'.format(line_num))
+            id_field = self.schema.get_id_field(obj)
+            # Statements only depend on node type, id field and columns, generate once for all rows sharing them
+            statement_key = (node_type, id_field, tuple(obj))
+            if loading_mode == UPSERT_MODE:
+                if statement_key not in statements:
+                    statements[statement_key] = self.get_upsert_statement(node_type, id_field, obj)
+                row_statement = statements[statement_key]
+            elif loading_mode == NEW_MODE:
+                if node_id in batch_ids or self.node_exists(tx, node_type, id_field, node_id):
+                    raise Exception(
+                        'Line: {}: Node (:{} {{ {}: {} }}) exists! Abort loading!'.format(line_num, node_type,
+                                                                                          id_field, node_id))
                 else:
-                    raise Exception('Wrong loading_mode: {}'.format(loading_mode))
-
-                if loading_mode != DELETE_MODE:
-                    result = tx.run(statement, obj)
-                    count = result.consume().counters.nodes_created
-                    #count the updated nodes
-                    update_count = 0
-                    if result.consume().counters.nodes_created == 0 and result.consume().counters.nodes_deleted == 0:
-                        update_count = 1
-                    self.nodes_created += count
-                    self.nodes_updated += update_count
+                    if statement_key not in statements:
+                        statements[statement_key] = self.get_new_statement(node_type, obj)
+                    row_statement = statements[statement_key]
+            elif loading_mode == DELETE_MODE:
+                n_deleted, r_deleted = self.delete_node(tx, obj)
+                nodes_deleted += n_deleted
+                relationship_deleted += r_deleted
+            else:
+                raise Exception('Wrong loading_mode: {}'.format(loading_mode))
+
+            if loading_mode != DELETE_MODE:
+                if row_statement != statement:
+                    count, update_count = self.run_node_batch(tx, batch_node_type, statement, batch)
                     nodes_created += count
                     nodes_updated += update_count
-                    self.nodes_stat[node_type] = self.nodes_stat.get(node_type, 0) + count
-                    self.nodes_stat_updated[node_type] = self.nodes_stat_updated.get(node_type, 0) + update_count
-                # commit and restart a transaction when batch size reached
-                if split and transaction_counter >= BATCH_SIZE:
-                    tx.commit()
-                    tx = session.begin_transaction()
-                    self.log.info(f'{line_num - 1} rows loaded ...')
-                    transaction_counter = 0
-            # commit last transaction
-            if split:
+                    statement = row_statement
+                    batch_node_type = node_type
+                    batch = []
+                    batch_ids = set()
+                batch.append(obj)
+                batch_ids.add(node_id)
+                if len(batch) >= self.batch_size:
+                    count, update_count = self.run_node_batch(tx, batch_node_type, statement, batch)
+                    nodes_created += count
+                    nodes_updated += update_count
+                    batch = []
+                    batch_ids = set()
+            # commit and restart a transaction when batch size reached
+            if split and tx.add_row():
+                count, update_count = self.run_node_batch(tx, batch_node_type, statement, batch)
+                nodes_created += count
+                nodes_updated += update_count
+                batch = []
+                batch_ids = set()
                 tx.commit()
+                self.log.info(f'{tx.committed} rows committed ...')
+        # load last batch, it's committed together with following files in split-transactions mode
+        count, update_count = self.run_node_batch(tx, batch_node_type, statement, batch)
+        nodes_created += count
+        nodes_updated += update_count
+
+        if loading_mode == DELETE_MODE:
+            self.log.info('{} node(s) deleted'.format(nodes_deleted))
+            self.log.info('{} relationship(s) deleted'.format(relationship_deleted))
+        else:
+            self.log.info('{} (:{}) node(s) loaded'.format(nodes_created, node_type))
+            self.log.info('{} (:{}) node(s) updated'.format(nodes_updated, node_type))
 
-            if loading_mode == DELETE_MODE:
-                self.log.info('{} node(s) deleted'.format(nodes_deleted))
-                self.log.info('{} relationship(s) deleted'.format(relationship_deleted))
-            else:
-                self.log.info('{} (:{}) node(s) loaded'.format(nodes_created, node_type))
-                self.log.info('{} (:{}) node(s) updated'.format(nodes_updated, node_type))
-
+    def run_node_batch(self, tx, node_type, statement, batch):
+        """
+        Create or update a batch of nodes with one UNWIND statement
+        :param tx: session or transaction to run the statement in
+        :param node_type: type of the nodes in the batch
+        :param statement: statement generated by get_new_statement or get_upsert_statement
+        :param batch: list of node objects
+        :return: a tuple of number of nodes created and number of nodes updated
+        """
+        if not batch:
+            return 0, 0
+        result = tx.run(statement, {BATCH_ROWS: batch})
+        count = result.consume().counters.nodes_created
+        # rows that didn't create a new node updated an existing one
+        update_count = len(batch) - count
+        self.nodes_created += count
+        self.nodes_updated += update_count
+        self.nodes_stat[node_type] = self.nodes_stat.get(node_type, 0) + count
+        self.nodes_stat_updated[node_type] = self.nodes_stat_updated.get(node_type, 0) + update_count
+        return count, update_count
 
     def node_exists(self, session, label, prop, value):
         statement = 'MATCH (m:{0} {{ {1}: ${1} }}) return m'.format(label, prop)
@@ -1092,97 +1272,142 @@ class DataLoader:
             raise Exception('Wrong loading_mode: {}'.format(loading_mode))
         self.log.info('{} relationships from file: {}'.format(action_word, file_name))
 
-        file_encoding = check_encoding(file_name)
-        with open(file_name, encoding=file_encoding) as in_file:
-            reader = csv.DictReader(in_file, delimiter='\t')
-            relationships_created = {}
-            int_nodes_created = 0
-            line_num = 1
-            transaction_counter = 0
-
-            # Use session in one transaction mode
-            tx = session
-            # Use transactions in split-transactions mode
-            if split:
-                tx = session.begin_transaction()
-            for org_obj in reader:
-                line_num += 1
-                transaction_counter += 1
-                obj = self.prepare_node(org_obj, file_name)
-                node_type = obj[NODE_TYPE]
-                results = self.collect_relationships(obj, tx, True, line_num)
-                relationships = results[RELATIONSHIPS]
-                int_nodes_created += results[INT_NODE_CREATED]
-                provided_parents = results[PROVIDED_PARENTS]
-                relationship_props = results[RELATIONSHIP_PROPS]
-                if provided_parents > 0:
-                    if len(relationships) == 0:
-                        raise Exception('Line: {}: No parents found, abort loading!'.format(line_num))
-                    for relationship in relationships:
-                        relationship_name = relationship[RELATIONSHIP_TYPE]
-                        multiplier = relationship[MULTIPLIER]
-                        parent_node = relationship[PARENT_TYPE]
-                        parent_id_field = relationship[PARENT_ID_FIELD]
-                        parent_id = relationship[PARENT_ID]
-                        properties = relationship_props.get(relationship_name, {})
-                        if multiplier in [DEFAULT_MULTIPLIER, ONE_TO_ONE]:
-                            if loading_mode == UPSERT_MODE:
-                                self.remove_old_relationship(tx, node_type, obj, relationship)
-                            elif loading_mode == NEW_MODE:
-                                if self.has_existing_relationship(tx, node_type, obj, relationship, True):
-                                    raise Exception(
-                                        'Line: {}: Relationship already exists, abort loading!'.format(line_num))
-                            else:
-                                raise Exception('Wrong loading_mode: {}'.format(loading_mode))
+        relationships_created = {}
+        int_nodes_created = 0
+        line_num = 1
+        # Relationships waiting to be sent to the database, grouped by statement
+        pending = {}
+        # Nodes (type, id field, id) referenced by pending relationships
+        pending_nodes = set()
+
+        # Session is the transaction in one transaction mode, or a BatchedTransaction in split-transactions mode
+        tx = session
+        for line_num, obj in read_ahead(self.read_prepared_nodes(file_name), self.batch_size):
+            node_type = obj[NODE_TYPE]
+            id_field = self.schema.get_id_field(obj)
+            # Queries below read existing relationships, make sure they can see pending ones
+            if self.conflicts_with_pending(obj, pending_nodes):
+                self.run_relationship_batches(tx, pending, relationships_created)
+                pending_nodes.clear()
+            results = self.collect_relationships(obj, current_transaction(tx), True, line_num)
+            relationships = results[RELATIONSHIPS]
+            int_nodes_created += results[INT_NODE_CREATED]
+            provided_parents = results[PROVIDED_PARENTS]
+            relationship_props = results[RELATIONSHIP_PROPS]
+            if provided_parents > 0:
+                if len(relationships) == 0:
+                    raise Exception('Line: {}: No parents found, abort loading!'.format(line_num))
+                for relationship in relationships:
+                    relationship_name = relationship[RELATIONSHIP_TYPE]
+                    multiplier = relationship[MULTIPLIER]
+                    parent_node = relationship[PARENT_TYPE]
+                    parent_id_field = relationship[PARENT_ID_FIELD]
+                    parent_id = relationship[PARENT_ID]
+                    properties = relationship_props.get(relationship_name, {})
+                    if multiplier in [DEFAULT_MULTIPLIER, ONE_TO_ONE]:
+                        if loading_mode == UPSERT_MODE:
+                            self.remove_old_relationship(tx, node_type, obj, relationship)
+                        elif loading_mode == NEW_MODE:
+                            if self.has_existing_relationship(tx, node_type, obj, relationship, True):
+                                raise Exception(
+                                    'Line: {}: Relationship already exists, abort loading!'.format(line_num))
                         else:
-                            self.log.debug('Multiplier: {}, no action needed!'.format(multiplier))
-                        prop_statement = ', '.join(self.get_relationship_prop_statements(properties))
-                        statement = 'MATCH (m:{0} {{ {1}: $__parentID__ }})'.format(parent_node, parent_id_field)
-                        statement += ' MATCH (n:{0} {{ {1}: ${1} }})'.format(node_type,
-                                                                             self.schema.get_id_field(obj))
-                        statement += ' MERGE (n)-[r:{}]->(m)'.format(relationship_name)
-                        statement += ' ON CREATE SET r.{} = datetime()'.format(CREATED)
-                        statement += ', {}'.format(prop_statement) if prop_statement else ''
-                        statement += ' ON MATCH SET r.{} = datetime()'.format(UPDATED)
-                        statement += ', {}'.format(prop_statement) if prop_statement else ''
-
-                        result = tx.run(statement, {**obj, "__parentID__": parent_id, **properties})
-                        count = result.consume().counters.relationships_created
-                        self.relationships_created += count
-                        relationship_pattern = '(:{})->[:{}]->(:{})'.format(node_type, relationship_name, parent_node)
-                        relationships_created[relationship_pattern] = relationships_created.get(relationship_pattern,
-                                                                                                0) + count
-                        self.relationships_stat[relationship_name] = self.relationships_stat.get(relationship_name,
-                                                                                                 0) + count
-                    for plugin in self.plugins:
-                        if plugin.should_run(node_type, NODE_LOADED):
-                            if plugin.create_node(session=tx, line_num=line_num, src=obj):
-                                int_nodes_created += 1
-                # commit and restart a transaction when batch size reached
-                if split and transaction_counter >= BATCH_SIZE:
-                    tx.commit()
-                    tx = session.begin_transaction()
-                    self.log.info(f'{line_num - 1} rows loaded ...')
-                    transaction_counter = 0
-
-            # commit last transaction
-            if split:
+                            raise Exception('Wrong loading_mode: {}'.format(loading_mode))
+                    else:
+                        self.log.debug('Multiplier: %s, no action needed!', multiplier)
+                    prop_statement = ', '.join(self.get_relationship_prop_statements(properties))
+                    statement = UNWIND_ROWS
+                    statement += ' MATCH (m:{0} {{ {1}: row.__parentID__ }})'.format(parent_node, parent_id_field)
+                    statement += ' MATCH (n:{0} {{ {1}: row.{1} }})'.format(node_type, id_field)
+                    statement += ' MERGE (n)-[r:{}]->(m)'.format(relationship_name)
+                    statement += ' ON CREATE SET r.{} = datetime()'.format(CREATED)
+                    statement += ', {}'.format(prop_statement) if prop_statement else ''
+                    statement += ' ON MATCH SET r.{} = datetime()'.format(UPDATED)
+                    statement += ', {}'.format(prop_statement) if prop_statement else ''
+
+                    if statement not in pending:
+                        relationship_pattern = '(:{})->[:{}]->(:{})'.format(node_type, relationship_name,
+                                                                            parent_node)
+                        pending[statement] = (relationship_name, relationship_pattern, [])
+                    pending[statement][2].append({**obj, "__parentID__": parent_id, **properties})
+                    pending_nodes.add((node_type, id_field, obj.get(id_field)))
+                    # Only one_to_one relationships read parent's existing relationships, see parent_already_has_child
+                    if multiplier == ONE_TO_ONE:
+                        pending_nodes.add((parent_node, parent_id_field, parent_id))
+                for plugin in self.plugins:
+                    if plugin.should_run(node_type, NODE_LOADED):
+                        # Plugins may depend on relationships of current node
+                        self.run_relationship_batches(tx, pending, relationships_created)
+                        pending_nodes.clear()
+                        if plugin.create_node(session=current_transaction(tx), line_num=line_num, src=obj):
+                            int_nodes_created += 1
+            if sum(len(rows) for _, _, rows in pending.values()) >= self.batch_size:
+                self.run_relationship_batches(tx, pending, relationships_created)
+                pending_nodes.clear()
+            # commit and restart a transaction when batch size reached
+            if split and tx.add_row():
+                self.run_relationship_batches(tx, pending, relationships_created)
+                pending_nodes.clear()
                 tx.commit()
-            if provided_parents == 0:
-                    self.log.warning('there is no parent mapping columns in the node {}'.format(node_type))
-            for rel, count in relationships_created.items():
-                self.log.info('{} {} relationship(s) loaded'.format(count, rel))
-            if int_nodes_created > 0:
-                self.log.info('{} intermediate node(s) loaded'.format(int_nodes_created))
+                self.log.info(f'{tx.committed} rows committed ...')
+
+        # load last batch, it's committed together with following files in split-transactions mode
+        self.run_relationship_batches(tx, pending, relationships_created)
+        if provided_parents == 0:
+                self.log.warning('there is no parent mapping columns in the node {}'.format(node_type))
+        for rel, count in relationships_created.items():
+            self.log.info('{} {} relationship(s) loaded'.format(count, rel))
+        if int_nodes_created > 0:
+            self.log.info('{} intermediate node(s) loaded'.format(int_nodes_created))
 
         return True
 
+    def conflicts_with_pending(self, obj, pending_nodes):
+        """
+        Check if loading relationships of given object needs to read relationships that haven't been sent to the
+        database yet
+        :param obj: input data object (dict)
+        :param pending_nodes: set of (type, id field, id) of nodes referenced by pending relationships
+        :return: boolean
+        """
+        if not pending_nodes:
+            return False
+        node_type = obj[NODE_TYPE]
+        id_field = self.schema.get_id_field(obj)
+        if (node_type, id_field, obj.get(id_field)) in pending_nodes:
+            return True
+        for key, value in obj.items():
+            if is_parent_pointer(key):
+                other_node, other_id = key.split('.')
+                if (other_node, other_id, value) in pending_nodes:
+                    return True
+                # Intermediate node plugins may query relationships around the missing parent
+                for plugin in self.plugins:
+                    if plugin.should_run(other_node, MISSING_PARENT):
+                        return True
+        return False
+
+    def run_relationship_batches(self, tx, pending, relationships_created):
+        """
+        Create all pending relationships, one UNWIND statement per relationship pattern
+        :param tx: session or transaction to run the statements in
+        :param pending: dict of statement -> (relationship name, relationship pattern, list of rows), will be emptied
+        :param relationships_created: dict of relationship pattern -> count, to be updated
+        """
+        for statement, (relationship_name, relationship_pattern, rows) in pending.items():
+            result = tx.run(statement, {BATCH_ROWS: rows})
+            count = result.consume().counters.relationships_created
+            self.relationships_created += count
+            relationships_created[relationship_pattern] = relationships_created.get(relationship_pattern, 0) + count
+            self.relationships_stat[relationship_name] = self.relationships_stat.get(relationship_name, 0) + count
+        pending.clear()
+
     @staticmethod
     def get_relationship_prop_statements(props):
         prop_stmts = []
 
         for key in props:
-            prop_stmts.append('r.{0} = ${0}'.format(key))
+            prop_stmts.append('r.{0} = row.{0}'.format(key))
         return prop_stmts
 
     def wipe_db(self, session, split=False):
@@ -1197,10 +1422,24 @@ class DataLoader:
             self.log.info('{} relationships deleted!'.format(self.relationships_deleted))
 
     def wipe_db_split(self, session):
+        if self.database_type == NEO4J:
+            # Neo4j splits the delete into transactions on server side, only works in auto-commit transactions
+            cleanup_db = f'MATCH (n) CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF {WIPE_BATCH_SIZE} ROWS'
+            try:
+                result = session.run(cleanup_db).consume()
+                self.nodes_deleted += result.counters.nodes_deleted
+                self.relationships_deleted += result.counters.relationships_deleted
+                self.log.info('{} nodes deleted!'.format(self.nodes_deleted))
+                self.log.info('{} relationships deleted!'.format(self.relationships_deleted))
+                return
+            except CypherSyntaxError as e:
+                # CALL { } IN TRANSACTIONS needs Neo4j 4.4 or later, delete in batches from client side instead
+                self.log.warning('Server side batched delete is not supported, deleting in client side batches: '
+                                 '{}'.format(e))
         while True:
             tx = session.begin_transaction()
             try:
-                cleanup_db = f'MATCH (n) WITH n LIMIT {BATCH_SIZE} DETACH DELETE n'
+                cleanup_db = f'MATCH (n) WITH n LIMIT {self.batch_size} DETACH DELETE n'
                 result = tx.run(cleanup_db).consume()
                 tx.commit()
                 deleted_nodes = result.counters.nodes_deleted
@@ -6,8 +6,10 @@ import os
 from collections import deque
 
 from bento.common.sqs import Queue, VisibilityExtender
-from bento.common.utils import get_logger, get_log_file, get_uuid, LOG_PREFIX, UUID, get_time_stamp, removeTrailingSlash, load_plugin
+from bento.common.utils import get_logger, get_log_file, LOG_PREFIX, UUID, get_time_stamp, removeTrailingSlash, load_plugin
 from copier import Copier
+from icdc_schema import generate_node_uuid
+from props import UUID5, UUID_ALGORITHMS
 from file_copier_config import MASTER_MODE, SLAVE_MODE, SOLO_MODE, Config
 from bento.common.s3 import upload_log_file
 
@@ -62,7 +64,7 @@ class FileLoader:
 
     def __init__(self, mode, adapter_module=None, adapter_class=None, adapter_params=None, domain=None, bucket=None,
                  prefix=None, pre_manifest=None, first=1, count=-1, job_queue=None, result_queue=None, retry=3,
-                 overwrite=False, dryrun=False, verify_md5=False, upload_log_dir = None):
+                 overwrite=False, dryrun=False, verify_md5=False, upload_log_dir = None, uuid_algorithm=UUID5):
         """"
 
         :param bucket: string type
@@ -103,6 +105,11 @@ class FileLoader:
                 raise ValueError(f'Empty domain!')
             self.domain = domain
 
+            # Must be same as "uuid_algorithm" in properties file used by data loader and file loader
+            if uuid_algorithm not in UUID_ALGORITHMS:
+                raise ValueError(f'Invalid uuid_algorithm: "{uuid_algorithm}"')
+            self.uuid_algorithm = uuid_algorithm
+
             self.adapter_config = {
                 self.ADAPTER_PARAMS: adapter_params,
                 self.ADAPTER_CLASS: adapter_class,
@@ -169,7 +176,8 @@ class FileLoader:
         record[self.MD5] = result[Copier.MD5]
         record[Copier.ACL] = result[Copier.ACL]
         record[self.URL] = self.get_s3_location(self.bucket_name, result[Copier.KEY])
-        record[self.GUID] = '{}{}'.format(self.INDEXD_GUID_PREFIX, get_uuid(self.domain, "file", record[self.URL]))
+        file_uuid = generate_node_uuid(self.domain, "file", record[self.URL], self.uuid_algorithm)
+        record[self.GUID] = '{}{}'.format(self.INDEXD_GUID_PREFIX, file_uuid)
         return record
 
     def populate_neo4j_record(self, record, result):
@@ -181,7 +189,7 @@ class FileLoader:
         file_name = result[Copier.NAME]
         record[self.MD5_SUM] = result[Copier.MD5]
         record[self.FILE_FORMAT] = (os.path.splitext(file_name)[1]).split('.')[1].lower()
-        record[UUID] = get_uuid(self.domain, "file", record[self.FILE_LOC])
+        record[UUID] = generate_node_uuid(self.domain, "file", record[self.FILE_LOC], self.uuid_algorithm)
         record[self.FILE_STAT] = self.DEFAULT_STAT
         record[Copier.ACL] = result[Copier.ACL]
         return record
@@ -2,6 +2,7 @@ import argparse
 import os
 
 from config_base import BentoConfig
+from props import UUID_ALGORITHMS
 
 MASTER_MODE = 'master'
 SLAVE_MODE = 'slave'
@@ -28,6 +29,8 @@ class Config(BentoConfig):
         parser.add_argument('--pre-manifest', help='Pre-manifest file')
         parser.add_argument('--adapter-module', help='Adapter module name')
         parser.add_argument('--adapter-class', help='Adapter class name')
+        parser.add_argument('--uuid-algorithm', help='Algorithm to generate UUIDs, must be same as "uuid_algorithm" '
+                                                     'in properties file', choices=UUID_ALGORITHMS)
         parser.add_argument('config_file', help='Confguration file')
         parser.add_argument('--upload-log-dir', help='Upload destination dir for log file,  if dir in s3, use the format, s3://[bucket]/[prefix]')
         args = parser.parse_args()
@@ -1,10 +1,13 @@
+import functools
+import hashlib
 import os
+import pickle
 import re
 import sys
+import uuid
 import yaml
-from bento.common.utils import get_logger, MULTIPLIER, DEFAULT_MULTIPLIER, RELATIONSHIP_TYPE, get_uuid, \
-    parse_date
-from props import Props
+from bento.common.utils import get_logger, MULTIPLIER, DEFAULT_MULTIPLIER, RELATIONSHIP_TYPE, parse_date
+from props import Props, SafeLoader, UUID5, BLAKE2B
 
 NODES = 'Nodes'
 KEY = "Key"
@@ -34,10 +37,155 @@ MAX = 'maximum'
 EX_MIN = 'exclusiveMinimum'
 EX_MAX = 'exclusiveMaximum'
 DESCRIPTION = 'Desc'
+UUID_CACHE_SIZE = 100000
+VALIDATION_CACHE_SIZE = 100000
+PARENT_POINTER_PATTERN = re.compile(r'\w+\.\w+')
+TRUE_PATTERN = re.compile(r'\byes\b|\btrue\b', re.IGNORECASE)
+FALSE_PATTERN = re.compile(r'\bno\b|\bfalse\b', re.IGNORECASE)
+LTF_PATTERN = re.compile(r'\bltf\b', re.IGNORECASE)
+SCHEMA_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                                'ctos-loader')
+SCHEMA_CACHE_ENTRIES = 10
 
 
 def is_parent_pointer(field_name):
-    return re.fullmatch(r'\w+\.\w+', field_name) is not None
+    return PARENT_POINTER_PATTERN.fullmatch(field_name) is not None
+
+
+@functools.lru_cache(maxsize=None)
+def get_type_uuid(domain, node_type):
+    """
+    Generate the V5 UUID used as namespace for all nodes of given type, it's same for the whole load
+    """
+    return uuid.uuid5(uuid.uuid5(uuid.NAMESPACE_URL, domain), node_type)
+
+
+@functools.lru_cache(maxsize=UUID_CACHE_SIZE)
+def get_node_uuid(domain, node_type, signature):
+    """
+    Generate V5 UUID for a node, same result as bento.common.utils.get_uuid. Cached since nodes are prepared more
+    than once during validating and loading, and parents are referenced by many children
+    """
+    return str(uuid.uuid5(get_type_uuid(domain, node_type), signature))
+
+
+@functools.lru_cache(maxsize=UUID_CACHE_SIZE)
+def get_blake2b_node_uuid(domain, node_type, signature):
+    """
+    Generate UUID for a node from one BLAKE2b hash of domain, node type and signature. Faster than get_node_uuid, but
+    generates different UUIDs, only used when "uuid_algorithm" is set to "blake2b" in properties file
+    Version and variant bits are set as RFC 4122 (RFC 9562) version 8 (custom) UUID, the other 122 bits are the hash
+    """
+    digest = hashlib.blake2b(domain.encode(), digest_size=16)
+    digest.update(b'\0')
+    digest.update(node_type.encode())
+    digest.update(b'\0')
+    digest.update(signature.encode())
+    value = int.from_bytes(digest.digest(), 'big')
+    value = (value & ~(0xf << 76)) | (8 << 76)
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)
+    return str(uuid.UUID(int=value))
+
+
+def generate_node_uuid(domain, node_type, signature, algorithm=UUID5):
+    """
+    Generate UUID for a node with given algorithm. Every tool generating node UUIDs (data loader, file loader, file
+    copier, UUID util) goes through this function, so one database never mixes UUIDs of different algorithms
+    :param domain: project's domain name
+    :param node_type: type of the node
+    :param signature: string that uniquely identifies the node within its type
+    :param algorithm: "uuid5" or "blake2b"
+    :return: UUID as a string
+    """
+    if algorithm == UUID5:
+        return get_node_uuid(domain, node_type, signature)
+    elif algorithm == BLAKE2B:
+        return get_blake2b_node_uuid(domain, node_type, signature)
+    else:
+        raise Exception('Unsupported uuid_algorithm: "{}"!'.format(algorithm))
+
+
+def get_schema_cache_key(yaml_files, prop_file):
+    """
+    Calculate SHA-256 of all schema files, properties file and the code that parses them
+
+    :param yaml_files: list of schema files, order matters since later files override earlier ones
+    :param prop_file: properties file
+    :return: hex digest, or None if any of the files doesn't exist
+    """
+    code_files = [os.path.abspath(__file__), os.path.join(os.path.dirname(os.path.abspath(__file__)), 'props.py')]
+    digest = hashlib.sha256()
+    for file_name in code_files + [prop_file] + list(yaml_files):
+        if not file_name or not os.path.isfile(file_name):
+            return None
+        with open(file_name, 'rb') as in_file:
+            content = in_file.read()
+        digest.update(str(len(content)).encode())
+        digest.update(b'\0')
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def prune_schema_cache(cache_dir, keep, log):
+    """
+    Remove all but the most recently used cached schemas
+
+    :param cache_dir: folder cached schemas are stored in
+    :param keep: number of cached schemas to keep
+    :param log: logger
+    """
+    try:
+        cache_files = [entry.path for entry in os.scandir(cache_dir)
+                       if entry.is_file() and entry.name.endswith('.pkl')]
+        cache_files.sort(key=os.path.getmtime, reverse=True)
+        for cache_file in cache_files[keep:]:
+            os.remove(cache_file)
+    except Exception as e:
+        log.warning('Can\'t prune cached schemas in "{}": {}'.format(cache_dir, e))
+
+
+def load_schema(yaml_files, prop_file, cache_dir=None):
+    """
+    Create ICDC_Schema object, if cache_dir is given, reuse the one pickled by a previous run if none of the input
+    files has changed. Parsing and processing big schema files takes seconds, which dominates short runs like --dry-run
+
+    :param yaml_files: list of schema files
+    :param prop_file: properties file
+    :param cache_dir: folder to store pickled schemas in, e.g. SCHEMA_CACHE_DIR, caching is disabled if it's empty
+    :return: ICDC_Schema object
+    """
+    log = get_logger('ICDC Schema')
+    cache_key = get_schema_cache_key(yaml_files, prop_file) if cache_dir else None
+    if not cache_key:
+        return ICDC_Schema(yaml_files, Props(prop_file))
+
+    cache_file = os.path.join(cache_dir, '{}.pkl'.format(cache_key))
+    if os.path.isfile(cache_file):
+        try:
+            with open(cache_file, 'rb') as in_file:
+                schema = pickle.load(in_file)
+            if isinstance(schema, ICDC_Schema):
+                log.info('Using cached schema: {}'.format(cache_file))
+                # Mark as recently used, so it won't be pruned
+                os.utime(cache_file)
+                return schema
+            log.warning('Invalid cached schema: {}'.format(cache_file))
+        except Exception as e:
+            log.warning('Can\'t read cached schema "{}": {}'.format(cache_file, e))
+
+    schema = ICDC_Schema(yaml_files, Props(prop_file))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first, so concurrent runs never read a partially written cache
+        tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(tmp_file, 'wb') as out_file:
+            pickle.dump(schema, out_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except Exception as e:
+        log.warning('Can\'t write cached schema "{}": {}'.format(cache_file, e))
+        return schema
+    prune_schema_cache(cache_dir, SCHEMA_CACHE_ENTRIES, log)
+    return schema
 
 
 class ICDC_Schema:
@@ -46,6 +194,7 @@ class ICDC_Schema:
             raise AssertionError
         self.props = props
         self.rel_prop_delimiter = props.rel_prop_delimiter
+        self.rel_prop_pattern = re.compile('^.+{}.+$'.format(re.escape(self.rel_prop_delimiter)))
         self.delimiter = props.delimiter
         if not yaml_files:
             raise Exception('File list is empty,could not initialize ICDC_Schema object!')
@@ -55,12 +204,13 @@ class ICDC_Schema:
                     raise Exception('File "{}" does not exist'.format(data_file))
         self.log = get_logger('ICDC Schema')
         self.org_schema = {}
+        self.type_validation_cache = {}
         for aFile in yaml_files:
             try:
                 self.log.info('Reading schema file: {} ...'.format(aFile))
                 if os.path.isfile(aFile):
                     with open(aFile) as schema_file:
-                        schema = yaml.safe_load(schema_file)
+                        schema = yaml.load(schema_file, Loader=SafeLoader)
                         if schema:
                             self.org_schema.update(schema)
             except Exception as e:
@@ -104,7 +254,17 @@ class ICDC_Schema:
                     raise Exception("More than one key property found for the same node")
         if len(id_fields) > 0:
             self.props.id_fields = id_fields
-            
+
+    def __getstate__(self):
+        # Logger is re-created and validation cache is emptied on unpickling, see load_schema()
+        state = self.__dict__.copy()
+        del state['log']
+        state['type_validation_cache'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.log = get_logger('ICDC Schema')
 
     def get_node_id(self, node_type):
         node_id_list = []
@@ -124,8 +284,7 @@ class ICDC_Schema:
         available
 
         """
-        str_signature = str(signature)
-        return get_uuid(self.props.domain, node_type, str_signature)
+        return generate_node_uuid(self.props.domain, node_type, str(signature), self.props.uuid_algorithm)
 
     def _process_properties(self, desc):
         """
@@ -442,7 +601,8 @@ class ICDC_Schema:
                     continue
 
                 prop_type = self.relationship_props[rel_type][PROPERTIES][rel_prop]
-                type_validation_result, error_type = self._validate_type(prop_type, value)
+                type_validation_result, error_type = self._validate_prop_type((RELATIONSHIPS, rel_type, rel_prop),
+                                                                              prop_type, value)
                 if not type_validation_result:
                     result['result'] = False
                     result['invalid_values'].append(value)
@@ -460,10 +620,11 @@ class ICDC_Schema:
                             'Property: "{}":"{}" is not a valid "{}" type!'.format(rel_prop, value, prop_type))
 
             elif key not in properties:
-                self.log.debug('Property "{}" is not in data model!'.format(key))
+                self.log.debug('Property "%s" is not in data model!', key)
             else:
                 prop_type = properties[key]
-                type_validation_result, error_type = self._validate_type(prop_type, value)
+                type_validation_result, error_type = self._validate_prop_type((NODES, model_type, key), prop_type,
+                                                                              value)
                 if not type_validation_result:
                     if type(error_type) is tuple:
                         result['result'] = False
@@ -523,6 +684,29 @@ class ICDC_Schema:
                 return False
         return True
 
+    def _validate_prop_type(self, prop_key, model_type, value):
+        """
+        Validate a value with _validate_type, results are cached by property and value since enum-like columns have
+        same values in many rows
+
+        :param prop_key: tuple identifies the property
+        :param model_type: dict specify value type and boundary/range
+        :param value: value to be validated
+        :return: same as _validate_type
+        """
+        cache_key = (prop_key, value)
+        try:
+            result = self.type_validation_cache.get(cache_key)
+        except TypeError:
+            # Unhashable values can't be cached
+            return self._validate_type(model_type, value)
+        if result is None:
+            result = self._validate_type(model_type, value)
+            if len(self.type_validation_cache) >= VALIDATION_CACHE_SIZE:
+                self.type_validation_cache.clear()
+            self.type_validation_cache[cache_key] = result
+        return result
+
     def _validate_type(self, model_type, str_value):
         wrong_type = "wrong_type"
         out_of_range = "out_of_range"
@@ -545,9 +729,9 @@ class ICDC_Schema:
             except ValueError:
                 return False, wrong_type
         elif model_type[PROP_TYPE] == 'Boolean':
-            if (str_value and not re.match(r'\byes\b|\btrue\b', str_value, re.IGNORECASE)
-                    and not re.match(r'\bno\b|\bfalse\b', str_value, re.IGNORECASE)
-                    and not re.match(r'\bltf\b', str_value, re.IGNORECASE)):
+            if (str_value and not TRUE_PATTERN.match(str_value)
+                    and not FALSE_PATTERN.match(str_value)
+                    and not LTF_PATTERN.match(str_value)):
                 return False, wrong_type
         elif model_type[PROP_TYPE] == 'Array':
             for item in self.get_list_values(str_value):
@@ -596,7 +780,7 @@ class ICDC_Schema:
                 self.log.error('No relationships found for "{}"-->"{}"'.format(src, dest))
                 return None
         else:
-            self.log.debug('No relationships start from "{}"'.format(src))
+            self.log.debug('No relationships start from "%s"', src)
             return None
 
     # Find destination node name from (:src)-[:name]->(:dest)
@@ -683,4 +867,4 @@ class ICDC_Schema:
             return obj[id_field]
 
     def is_relationship_property(self, key):
-        return re.match('^.+\{}.+$'.format(self.rel_prop_delimiter), key)
+        return self.rel_prop_pattern.match(key)
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 import argparse
-import glob
 import os
 import sys
 import zipfile
@@ -9,8 +8,7 @@ from neo4j import GraphDatabase
 from neo4j.exceptions import ServiceUnavailable
 from neo4j.exceptions import AuthError
 
-from icdc_schema import ICDC_Schema
-from props import Props
+from icdc_schema import load_schema, SCHEMA_CACHE_DIR
 from bento.common.utils import get_logger, removeTrailingSlash, check_schema_files, UPSERT_MODE, NEW_MODE, DELETE_MODE, \
     get_log_file, LOG_PREFIX, APP_NAME, load_plugin, print_config
 from create_index import NEO4J, MEMGRAPH
@@ -27,6 +25,26 @@ from bento.common.s3 import S3Bucket, upload_log_file
 DEFAULT_MAX_VIOLATIONS = 1000000
 DEFAULT_TEMP_FOLDER = "tmp"
 
+
+def get_data_files(directory):
+    """
+    List data files in given directory with one scan, .txt files come before .tsv files
+    :param directory: dataset directory
+    :return: list of file paths
+    """
+    txt_files = []
+    tsv_files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            # Hidden files are skipped, same as glob
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            if entry.name.endswith('.txt'):
+                txt_files.append(entry.path)
+            elif entry.name.endswith('.tsv'):
+                tsv_files.append(entry.path)
+    return txt_files + tsv_files
+
 def parse_arguments(args = None):
     parser = argparse.ArgumentParser(description='Load TSV(TXT) files (from Pentaho) into Neo4j')
     parser.add_argument('-i', '--uri', help='Neo4j uri like bolt://12.34.56.78:7687')
@@ -49,8 +67,10 @@ def parse_arguments(args = None):
     parser.add_argument('-f', '--s3-folder', help='S3 folder')
     parser.add_argument('-m', '--mode', help='Loading mode', choices=[UPSERT_MODE, NEW_MODE, DELETE_MODE])
     parser.add_argument('--dataset', help='Dataset directory')
-    parser.add_argument('--split-transactions', help='Creates a separate transaction for each file',
-                        action='store_true')
+    parser.add_argument('--split-transactions', help='Commits every batch_size rows across all files, instead of '
+                                                     'loading all files in one transaction', action='store_true')
+    parser.add_argument('--batch-size', help='Number of rows per statement, and per transaction in split '
+                                             'transactions mode', type=int)
     parser.add_argument('--upload-log-dir', help='Upload destination dir for log file,  if dir in s3, use the format, s3://[bucket]/[prefix]')
     parser.add_argument('--database-type', help='The database type, can be either neo4j or memgraph', choices=[NEO4J, MEMGRAPH])
     return parser.parse_args(args)
@@ -71,7 +91,8 @@ def process_arguments(args, log):
 
     if args.s3_folder:
         config.s3_folder = args.s3_folder
-    if not config.s3_folder and not os.path.isdir(config.dataset):
+    dataset_is_dir = os.path.isdir(config.dataset)
+    if not config.s3_folder and not dataset_is_dir:
         log.error('{} is not a directory!'.format(config.dataset))
         sys.exit(1)
 
@@ -101,6 +122,8 @@ def process_arguments(args, log):
     # Conditionally Required Fields
     if args.split_transactions:
         config.split_transactions = args.split_transactions
+    if args.batch_size is not None:
+        config.batch_size = args.batch_size
     if args.no_backup:
         config.no_backup = args.no_backup
     if args.backup_folder:
@@ -114,23 +137,24 @@ def process_arguments(args, log):
         sys.exit(1)
 
     if config.s3_folder:
-        if not os.path.exists(config.dataset):
-            os.makedirs(config.dataset)
-        else:
-            exist_files = glob.glob('{}/*.txt'.format(config.dataset))
-            if len(exist_files) > 0:
-                log.error('Folder: "{}" is not empty, please empty it first'.format(config.dataset))
-                sys.exit(1)
-
         if args.bucket:
             config.s3_bucket = args.bucket
         if not config.s3_bucket:
             log.error('Please specify S3 bucket name with -b/--bucket argument!')
             sys.exit(1)
-        bucket = S3Bucket(config.s3_bucket)
-        if not os.path.isdir(config.dataset):
+
+        if dataset_is_dir:
+            exist_files = get_data_files(config.dataset)
+            if len(exist_files) > 0:
+                log.error('Folder: "{}" is not empty, please empty it first'.format(config.dataset))
+                sys.exit(1)
+        elif os.path.exists(config.dataset):
             log.error('{} is not a directory!'.format(config.dataset))
             sys.exit(1)
+        else:
+            os.makedirs(config.dataset)
+
+        bucket = S3Bucket(config.s3_bucket)
         log.info(f'Loading data from s3://{config.s3_bucket}/{config.s3_folder}')
         if not bucket.download_files_in_folder(config.s3_folder, config.dataset):
             log.error('Download files from S3 bucket "{}" failed!'.format(config.s3_bucket))
@@ -221,9 +245,7 @@ def main(args):
     restore_cmd = ''
     load_result = None
     try:
-        txt_files = glob.glob('{}/*.txt'.format(config.dataset))
-        tsv_files = glob.glob('{}/*.tsv'.format(config.dataset))
-        file_list = txt_files + tsv_files
+        file_list = get_data_files(config.dataset)
         if file_list:
             if config.wipe_db and not config.yes:
                 if not confirm_deletion('Wipe out entire Neo4j database before loading?'):
@@ -234,11 +256,10 @@ def main(args):
                     sys.exit(1)
 
             prop_path = os.path.join(config.dataset, config.prop_file)
-            if os.path.isfile(prop_path):
-                props = Props(prop_path)
-            else:
-                props = Props(config.prop_file)
-            schema = ICDC_Schema(config.schema_files, props)
+            if not os.path.isfile(prop_path):
+                prop_path = config.prop_file
+            # Validation only runs are often repeated on same schema, cache parsed schema for them
+            schema = load_schema(config.schema_files, prop_path, SCHEMA_CACHE_DIR if config.dry_run else None)
             if not config.dry_run or config.loading_mode == DELETE_MODE:
                 driver = GraphDatabase.driver(
                     config.neo4j_uri,
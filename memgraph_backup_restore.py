@@ -23,6 +23,7 @@ def backup_memgraph_mgconsole(memgraph_backup_dir, memgraph_dump_dir, memgraph_u
         subprocess.run(backup_command, shell=True)
         dump_file_key = os.path.join(memgraph_dump_dir, memgraph_dump_file_name)
         dest_file_path = os.path.join(memgraph_backup_dir, memgraph_dump_file_name)
+        os.makedirs(memgraph_backup_dir, exist_ok=True)
         shutil.copy2(dump_file_key, dest_file_path)
         log.info(f"Successfully copied the backup snapshot file {dump_file_key} to {dest_file_path}")
         return dest_file_path
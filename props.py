@@ -1,13 +1,22 @@
 import os
 import yaml
+# Use LibYAML based loader if available, it's much faster than pure Python one
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 from bento.common.utils import get_logger
 
+UUID5 = 'uuid5'
+BLAKE2B = 'blake2b'
+UUID_ALGORITHMS = [UUID5, BLAKE2B]
+
 class Props:
     def __init__(self, file_name):
         self.log = get_logger('Props')
         if file_name and os.path.isfile(file_name):
             with open(file_name) as prop_file:
-                props = yaml.safe_load(prop_file)['Properties']
+                props = yaml.load(prop_file, Loader=SafeLoader)['Properties']
                 if not props:
                     msg = 'Can\'t read property file!'
                     self.log.error(msg)
@@ -21,7 +30,23 @@ class Props:
                 self.indexes = props.get('indexes', [])
                 self.save_parent_id = props.get('save_parent_id', [])
                 self.delimiter = props.get("delimiter", "|")
+                # Changing algorithm changes generated UUIDs, only switch when data will be reloaded from scratch
+                self.uuid_algorithm = props.get('uuid_algorithm', UUID5)
+                if self.uuid_algorithm not in UUID_ALGORITHMS:
+                    msg = f'Unsupported uuid_algorithm: "{self.uuid_algorithm}"!'
+                    self.log.error(msg)
+                    raise Exception(msg)
         else:
             msg = f'Can NOT open file: "{file_name}"'
             self.log.error(msg)
             raise Exception(msg)
+
+    def __getstate__(self):
+        # Loggers are re-created on unpickling, so cached objects log the same way as freshly created ones
+        state = self.__dict__.copy()
+        del state['log']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.log = get_logger('Props')
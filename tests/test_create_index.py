@@ -0,0 +1,34 @@
+import unittest
+from bento.common.utils import get_logger
+from create_index import create_indexes, NEO4J
+from icdc_schema import ICDC_Schema
+from props import Props
+
+
+class FakeSession:
+    def __init__(self):
+        self.commands = []
+
+    def run(self, command):
+        self.commands.append(command)
+        # SHOW INDEXES reports no existing indexes
+        return []
+
+
+class TestCreateIndexes(unittest.TestCase):
+    def setUp(self):
+        self.log = get_logger('Test Create Index')
+        props = Props('../config/props-icdc.yml')
+        self.schema = ICDC_Schema(['data/icdc-model.yml', 'data/icdc-model-props.yml'], props)
+        self.session = FakeSession()
+        create_indexes(self.session, self.schema, self.log, NEO4J)
+
+    def test_no_uuid_index_for_id_fields(self):
+        for node_name, id_field in self.schema.props.id_fields.items():
+            expected = ['CREATE INDEX ON :{}({});'.format(node_name, id_field)]
+            node_commands = [c for c in self.session.commands if c.startswith('CREATE INDEX ON :{}('.format(node_name))]
+            self.assertEqual(expected, node_commands)
+
+    def test_uuid_index_without_id_field(self):
+        for node_name in ['file', 'demographic']:
+            self.assertEqual(1, self.session.commands.count('CREATE INDEX ON :{}(uuid);'.format(node_name)))
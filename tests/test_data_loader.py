@@ -0,0 +1,386 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from neo4j.exceptions import CypherSyntaxError
+from bento.common.utils import UPSERT_MODE, NEW_MODE, NODE_LOADED, MISSING_PARENT
+from data_loader import DataLoader, BatchedTransaction, open_tsv, read_ahead
+from icdc_schema import ICDC_Schema
+from props import Props
+
+
+class TestOpenTsv(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def read_rows(self, content):
+        file_name = os.path.join(self.folder, 'data.txt')
+        with open(file_name, 'w') as data_file:
+            data_file.write(content)
+        with open_tsv(file_name) as reader:
+            return list(reader)
+
+    def test_rows(self):
+        rows = self.read_rows('type\tid\tname\ncase\tc1\tfoo\ncase\tc2\t\n')
+        self.assertEqual([{'type': 'case', 'id': 'c1', 'name': 'foo'}, {'type': 'case', 'id': 'c2', 'name': ''}],
+                         rows)
+
+    def test_empty_file(self):
+        self.assertEqual([], self.read_rows(''))
+        self.assertEqual([], self.read_rows('type\tid\n'))
+
+    def test_trailing_tab(self):
+        # Excel exports end data rows with a tab but not the header, values must not shift into other columns
+        rows = self.read_rows('type\tid\tname\ncase\tc1\tfoo\t\n')
+        self.assertEqual([{'type': 'case', 'id': 'c1', 'name': 'foo', None: ['']}], rows)
+
+    def test_long_row(self):
+        rows = self.read_rows('type\tid\tname\ncase\tc1\tfoo\ncase\tc2\tbar\textra\n')
+        self.assertEqual(2, len(rows))
+        self.assertEqual({'type': 'case', 'id': 'c2', 'name': 'bar', None: ['extra']}, rows[1])
+
+    def test_short_row(self):
+        rows = self.read_rows('type\tid\tname\ncase\tc1\n')
+        self.assertEqual([{'type': 'case', 'id': 'c1', 'name': None}], rows)
+
+    def test_duplicated_header(self):
+        # Repeated header must not be renamed into something like "id.1", which looks like a parent pointer
+        rows = self.read_rows('type\tid\tid\ncase\tc1\tc2\n')
+        self.assertEqual([{'type': 'case', 'id': 'c2'}], rows)
+
+
+class TestReadAhead(unittest.TestCase):
+    def test_items(self):
+        self.assertEqual(list(range(100)), list(read_ahead(range(100), 10)))
+        self.assertEqual([], list(read_ahead([], 10)))
+
+    def test_error(self):
+        def items():
+            yield 1
+            raise ValueError('Bad row')
+
+        results = []
+        with self.assertRaises(ValueError):
+            for item in read_ahead(items(), 10):
+                results.append(item)
+        # Items before the error are still consumed
+        self.assertEqual([1], results)
+
+    def test_system_exit(self):
+        # Cheat mode validation calls sys.exit() while preparing rows
+        def items():
+            yield 1
+            raise SystemExit(1)
+
+        with self.assertRaises(SystemExit):
+            list(read_ahead(items(), 10))
+
+    def test_consumer_stops_early(self):
+        produced = []
+
+        def items():
+            while True:
+                produced.append(len(produced))
+                yield produced[-1]
+
+        # Compare thread sets, not counts, threads left by other tests may end meanwhile
+        threads = set(threading.enumerate())
+        reader = read_ahead(items(), 5)
+        self.assertEqual([0, 1, 2], [next(reader) for _ in range(3)])
+        reader.close()
+        for _ in range(50):
+            if not set(threading.enumerate()) - threads:
+                break
+            time.sleep(0.1)
+        self.assertEqual(set(), set(threading.enumerate()) - threads)
+        # Producer can only get one queue size ahead of consumer
+        self.assertLessEqual(len(produced), 3 + 5 + 2)
+
+
+class FakeCounters:
+    def __init__(self, count):
+        self.nodes_created = count
+        self.relationships_created = count
+
+
+class FakeResult:
+    def __init__(self, rows, exists):
+        self.rows = rows
+        self.exists = exists
+
+    def consume(self):
+        return self
+
+    @property
+    def counters(self):
+        return FakeCounters(len(self.rows))
+
+    def data(self):
+        return [{'m': {}}] if self.exists else []
+
+    def single(self):
+        return None
+
+
+class FakeTransaction:
+    """
+    Records statements instead of running them, all nodes looked up exist if "exists" is True
+    """
+    def __init__(self, exists=True):
+        self.exists = exists
+        self.statements = []
+
+    def run(self, statement, params=None, **kwargs):
+        self.statements.append(statement)
+        rows = params.get('rows', []) if params else []
+        return FakeResult(rows, self.exists)
+
+    def unwind_count(self):
+        return len([statement for statement in self.statements if statement.startswith('UNWIND')])
+
+
+class FakeSessionTransaction(FakeTransaction):
+    def __init__(self, exists=True):
+        super().__init__(exists)
+        self.committed = False
+
+    def commit(self):
+        self.committed = True
+
+
+class FakeSession:
+    def __init__(self, exists=True):
+        self.exists = exists
+        self.transactions = []
+
+    def begin_transaction(self):
+        self.transactions.append(FakeSessionTransaction(self.exists))
+        return self.transactions[-1]
+
+    def committed_statements(self):
+        return [len(tx.statements) for tx in self.transactions if tx.committed]
+
+
+class FakePlugin:
+    def __init__(self, node_type, tx):
+        self.node_type = node_type
+        self.tx = tx
+        self.nodes_stat = {}
+        self.relationships_stat = {}
+        self.nodes_created = 0
+        self.relationships_created = 0
+        self.unwind_counts = []
+
+    def should_run(self, node_type, event):
+        return node_type == self.node_type and event == NODE_LOADED
+
+    def create_node(self, session, line_num, src):
+        self.unwind_counts.append(self.tx.unwind_count())
+        return False
+
+
+class FakeMissingParentPlugin:
+    """
+    Creates missing parents, only accepts real transactions like VisitCreator does
+    """
+    def __init__(self, node_type):
+        self.node_type = node_type
+        self.nodes_stat = {}
+        self.relationships_stat = {}
+        self.nodes_created = 0
+        self.relationships_created = 0
+        self.sessions = []
+
+    def should_run(self, node_type, event):
+        return node_type == self.node_type and event == MISSING_PARENT
+
+    def create_node(self, session, line_num, node_type, node_id, src):
+        if not isinstance(session, FakeSessionTransaction):
+            return False
+        self.sessions.append(session)
+        return True
+
+
+class FakeConfig:
+    def __init__(self, batch_size):
+        self.database_type = 'neo4j'
+        self.batch_size = batch_size
+
+
+class TestBatchedTransaction(unittest.TestCase):
+    def test_commit_at_batch_size(self):
+        session = FakeSession()
+        tx = BatchedTransaction(session, 3)
+        for i in range(7):
+            tx.run('statement {}'.format(i))
+            if tx.add_row():
+                tx.commit()
+        self.assertEqual([3, 3], session.committed_statements())
+        self.assertEqual(6, tx.committed)
+        self.assertEqual(3, len(session.transactions))
+        tx.close()
+        self.assertEqual([3, 3, 1], session.committed_statements())
+        self.assertEqual(7, tx.committed)
+
+
+class TestBatching(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        props = Props('../config/props-icdc.yml')
+        self.schema = ICDC_Schema(['data/icdc-model.yml', 'data/icdc-model-props.yml'], props)
+        self.loader = self.create_loader()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def create_loader(self, plugins=None):
+        loader = DataLoader(None, self.schema, plugins=plugins)
+        # Initialized by load()
+        loader.nodes_stat_updated = {}
+        return loader
+
+    def write_file(self, lines):
+        file_name = os.path.join(self.folder, 'data.txt')
+        with open(file_name, 'w') as data_file:
+            data_file.write('\n'.join(lines) + '\n')
+        return file_name
+
+    def test_nodes_grouped_by_statement(self):
+        lines = ['type\tcase_id\tpatient_id']
+        lines += ['case\tc{}\tp{}'.format(i, i) for i in range(10)]
+        tx = FakeTransaction()
+        self.loader.load_nodes(tx, self.write_file(lines), UPSERT_MODE)
+        self.assertEqual(1, tx.unwind_count())
+        self.assertEqual(10, self.loader.nodes_stat['case'])
+
+    def test_new_mode_duplicated_id_in_batch(self):
+        lines = ['type\tcase_id', 'case\tc1', 'case\tc2', 'case\tc1']
+        tx = FakeTransaction(exists=False)
+        self.assertRaises(Exception, self.loader.load_nodes, tx, self.write_file(lines), NEW_MODE)
+        self.assertEqual(0, tx.unwind_count())
+
+    def test_many_to_one_relationships_batched(self):
+        lines = ['type\tcase.case_id\tcycle_number']
+        lines += ['cycle\tc{}\t{}'.format(i // 50, i) for i in range(500)]
+        tx = FakeTransaction()
+        self.loader.load_relationships(tx, self.write_file(lines), UPSERT_MODE)
+        self.assertEqual(1, tx.unwind_count())
+        self.assertEqual(500, self.loader.relationships_created)
+
+    def test_one_to_one_relationships_flushed(self):
+        # Each row after the first points to a parent with a pending relationship
+        lines = ['type\tcase.case_id\tbreed']
+        lines += ['demographic\tc1\tb{}'.format(i) for i in range(5)]
+        tx = FakeTransaction()
+        self.loader.load_relationships(tx, self.write_file(lines), UPSERT_MODE)
+        self.assertEqual(5, tx.unwind_count())
+
+    def test_flush_before_plugin(self):
+        lines = ['type\tcase.case_id\tcycle_number', 'cycle\tc1\t1', 'cycle\tc1\t2']
+        tx = FakeTransaction()
+        plugin = FakePlugin('cycle', tx)
+        loader = self.create_loader([plugin])
+        loader.load_relationships(tx, self.write_file(lines), UPSERT_MODE)
+        # Relationships of current row are created before the plugin runs
+        self.assertEqual([1, 2], plugin.unwind_counts)
+
+    def test_split_transaction_across_files(self):
+        file_names = []
+        for i in range(2):
+            file_names.append(os.path.join(self.folder, 'case{}.txt'.format(i)))
+            with open(file_names[-1], 'w') as data_file:
+                data_file.write('type\tcase_id\ncase\tc{0}1\ncase\tc{0}2\n'.format(i))
+        session = FakeSession()
+        self.loader.batch_size = 3
+        self.loader._load_all(session, file_names, UPSERT_MODE, True, False)
+        # 4 rows of nodes and 4 rows of relationships, committed every 3 rows, not at the end of each file
+        self.assertEqual(3, len(session.transactions))
+        self.assertTrue(all(tx.committed for tx in session.transactions))
+        self.assertEqual(4, self.loader.nodes_stat['case'])
+
+    def test_split_transaction_missing_parent_plugin(self):
+        lines = ['type\tvisit.visit_id\tday_in_cycle']
+        lines += ['physical_exam\tv{}\t{}'.format(i, i) for i in range(5)]
+        session = FakeSession(exists=False)
+        plugin = FakeMissingParentPlugin('visit')
+        loader = self.create_loader([plugin])
+        loader.batch_size = 3
+        loader._load_all(session, [self.write_file(lines)], UPSERT_MODE, True, False)
+        # Plugin is given the transaction open at the time, not the BatchedTransaction wrapping it
+        self.assertEqual(5, len(plugin.sessions))
+        self.assertTrue(all(tx in session.transactions for tx in plugin.sessions))
+        self.assertEqual(5, loader.relationships_created)
+
+    def test_batch_size_from_config(self):
+        loader = DataLoader(None, self.schema, FakeConfig(500))
+        self.assertEqual(500, loader.batch_size)
+        loader = DataLoader(None, self.schema, FakeConfig(None))
+        self.assertEqual(1000, loader.batch_size)
+
+    def test_invalid_batch_size(self):
+        for batch_size in ['500', 0, -1, 1.5, True]:
+            with self.assertRaises(Exception, msg=repr(batch_size)):
+                DataLoader(None, self.schema, FakeConfig(batch_size))
+
+
+class FakeWipeResult:
+    def __init__(self, nodes_deleted):
+        self.nodes_deleted = nodes_deleted
+        self.relationships_deleted = nodes_deleted
+
+    def consume(self):
+        return self
+
+    @property
+    def counters(self):
+        return self
+
+
+class OldServerSession:
+    """
+    Session of a Neo4j server older than 4.4, which doesn't support CALL { } IN TRANSACTIONS
+    """
+    def __init__(self, nodes, batch_size):
+        self.nodes = nodes
+        self.batch_size = batch_size
+        self.transactions = 0
+
+    def run(self, statement):
+        if 'IN TRANSACTIONS' in statement:
+            raise CypherSyntaxError('Invalid input')
+        deleted = min(self.nodes, self.batch_size)
+        self.nodes -= deleted
+        return FakeWipeResult(deleted)
+
+    def begin_transaction(self):
+        self.transactions += 1
+        return self
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class TestWipe(unittest.TestCase):
+    def test_wipe_old_server(self):
+        props = Props('../config/props-icdc.yml')
+        schema = ICDC_Schema(['data/icdc-model.yml', 'data/icdc-model-props.yml'], props)
+        loader = DataLoader(None, schema)
+        loader.batch_size = 10
+        session = OldServerSession(25, loader.batch_size)
+        loader.wipe_db(session, True)
+        self.assertEqual(0, session.nodes)
+        self.assertEqual(25, loader.nodes_deleted)
+        # 3 batches of deletes and 1 more to find nothing is left
+        self.assertEqual(4, session.transactions)
+
+
+if __name__ == '__main__':
+    unittest.main()
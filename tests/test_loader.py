@@ -1,7 +1,11 @@
 import unittest
+import glob
 import os
+import shutil
+import tempfile
 from bento.common.utils import get_logger, removeTrailingSlash, UUID
 from data_loader import DataLoader
+from loader import get_data_files
 from icdc_schema import ICDC_Schema
 from props import Props
 from neo4j import GraphDatabase
@@ -114,5 +118,33 @@ class TestLoader(unittest.TestCase):
         self.assertEqual(obj['file_size'], 15)
 
 
+class TestGetDataFiles(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def create_file(self, name):
+        with open(os.path.join(self.folder, name), 'w'):
+            pass
+
+    def test_get_data_files(self):
+        for name in ['b.tsv', 'a.txt', 'c.txt', '.hidden.txt', '.hidden.tsv', 'd.csv', 'e.txt.bak']:
+            self.create_file(name)
+        os.mkdir(os.path.join(self.folder, 'folder.txt'))
+        os.mkdir(os.path.join(self.folder, 'folder.tsv'))
+
+        file_list = get_data_files(self.folder)
+        self.assertEqual(['a.txt', 'c.txt'], sorted(os.path.basename(name) for name in file_list[:2]))
+        self.assertEqual(['b.tsv'], [os.path.basename(name) for name in file_list[2:]])
+        # Same files in same order as globbing .txt and then .tsv files, except folders
+        globbed = glob.glob('{}/*.txt'.format(self.folder)) + glob.glob('{}/*.tsv'.format(self.folder))
+        self.assertEqual([name for name in globbed if os.path.isfile(name)], file_list)
+
+    def test_empty_folder(self):
+        self.assertEqual([], get_data_files(self.folder))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,16 @@
+import os
+import pickle
+import shutil
+import tempfile
 import unittest
-from icdc_schema import ICDC_Schema
-from props import Props
+import uuid
+from unittest.mock import patch
+from bento.common.utils import get_logger
+from icdc_schema import ICDC_Schema, NODES, RELATIONSHIPS, PROP_TYPE, ENUM, generate_node_uuid, get_schema_cache_key, load_schema, prune_schema_cache
+from props import Props, UUID5, BLAKE2B
+
+SCHEMA_FILES = ['data/icdc-model.yml', 'data/icdc-model-props.yml']
+PROP_FILE = '../config/props-icdc.yml'
 
 
 class TestSchema(unittest.TestCase):
@@ -48,6 +58,142 @@ class TestSchema(unittest.TestCase):
         self.assertEqual(self.schema.get_id_field({'type': 'file'}), 'uuid')
         self.assertEqual(self.schema.get_id_field({'type': 'demographic'}), 'uuid')
 
+    def test_uuid_algorithms(self):
+        # UUIDs already in databases, must never change
+        domain = 'caninecommons.cancer.gov'
+        self.assertEqual('f0cf40a7-3cdb-51fe-a596-e29e40123f56', generate_node_uuid(domain, 'case', '123'))
+        self.assertEqual('f0cf40a7-3cdb-51fe-a596-e29e40123f56', generate_node_uuid(domain, 'case', '123', UUID5))
+        self.assertEqual('c8d3cebb-4db6-85dc-a676-e9bad4b29a1e', generate_node_uuid(domain, 'case', '123', BLAKE2B))
+        self.assertRaises(Exception, generate_node_uuid, domain, 'case', '123', 'md5')
+        blake2b_uuid = uuid.UUID(generate_node_uuid(domain, 'case', '123', BLAKE2B))
+        self.assertEqual(uuid.RFC_4122, blake2b_uuid.variant)
+        self.assertEqual(8, blake2b_uuid.version)
+
+        self.assertEqual('uuid5', self.props.uuid_algorithm)
+        self.assertEqual('f0cf40a7-3cdb-51fe-a596-e29e40123f56', self.schema.get_uuid_for_node('case', '123'))
+        self.props.uuid_algorithm = BLAKE2B
+        self.assertEqual('c8d3cebb-4db6-85dc-a676-e9bad4b29a1e', self.schema.get_uuid_for_node('case', '123'))
+
+
+class TestValidatePropType(unittest.TestCase):
+    INT_TYPE = {PROP_TYPE: 'Int'}
+    ENUM_TYPE = {PROP_TYPE: 'String', ENUM: ['Yes', 'No']}
+
+    def setUp(self):
+        props = Props(PROP_FILE)
+        self.schema = ICDC_Schema(SCHEMA_FILES, props)
+        self.schema.type_validation_cache.clear()
+
+    def test_cache_hit(self):
+        key = (NODES, 'case', 'age')
+        for value in ['5', 'five', '']:
+            expected = self.schema._validate_type(self.INT_TYPE, value)
+            self.assertEqual(expected, self.schema._validate_prop_type(key, self.INT_TYPE, value))
+            self.assertEqual(expected, self.schema._validate_prop_type(key, self.INT_TYPE, value))
+        self.assertEqual(3, len(self.schema.type_validation_cache))
+
+    def test_node_and_relationship_keys(self):
+        node_key = (NODES, 'case', 'status')
+        rel_key = (RELATIONSHIPS, 'of_case', 'status')
+        self.assertEqual((True, 'pass'), self.schema._validate_prop_type(node_key, self.INT_TYPE, '5'))
+        self.assertEqual((False, 'non_permissive_value'),
+                         self.schema._validate_prop_type(rel_key, self.ENUM_TYPE, '5'))
+        self.assertEqual((True, 'pass'), self.schema._validate_prop_type(node_key, self.INT_TYPE, '5'))
+        self.assertEqual(2, len(self.schema.type_validation_cache))
+
+    def test_unhashable_value(self):
+        object_type = {PROP_TYPE: 'Object'}
+        result = self.schema._validate_prop_type((NODES, 'case', 'extra'), object_type, {'a': 1})
+        self.assertEqual(self.schema._validate_type(object_type, {'a': 1}), result)
+        self.assertEqual(0, len(self.schema.type_validation_cache))
+
+    def test_cache_cleared_when_full(self):
+        key = (NODES, 'case', 'age')
+        with patch('icdc_schema.VALIDATION_CACHE_SIZE', 3):
+            for value in ['1', '2', '3']:
+                self.schema._validate_prop_type(key, self.INT_TYPE, value)
+            self.assertEqual(3, len(self.schema.type_validation_cache))
+            self.schema._validate_prop_type(key, self.INT_TYPE, '4')
+        self.assertEqual({(key, '4'): (True, 'pass')}, self.schema.type_validation_cache)
+
+
+class TestSchemaCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def cache_files(self):
+        return [name for name in os.listdir(self.folder) if name.endswith('.pkl')]
+
+    def test_pickle(self):
+        schema = ICDC_Schema(SCHEMA_FILES, Props(PROP_FILE))
+        schema.type_validation_cache['key'] = True
+        copy = pickle.loads(pickle.dumps(schema))
+        self.assertIsInstance(copy, ICDC_Schema)
+        self.assertEqual(schema.nodes, copy.nodes)
+        self.assertEqual(schema.relationships, copy.relationships)
+        self.assertEqual(schema.props.id_fields, copy.props.id_fields)
+        self.assertEqual({}, copy.type_validation_cache)
+        self.assertIsNotNone(copy.log)
+        self.assertIsNotNone(copy.props.log)
+        self.assertEqual(schema.get_uuid_for_node('case', '123'), copy.get_uuid_for_node('case', '123'))
+
+    def test_cache_key(self):
+        key = get_schema_cache_key(SCHEMA_FILES, PROP_FILE)
+        self.assertEqual(key, get_schema_cache_key(SCHEMA_FILES, PROP_FILE))
+        # Later schema files override earlier ones, so order matters
+        self.assertNotEqual(key, get_schema_cache_key(list(reversed(SCHEMA_FILES)), PROP_FILE))
+        self.assertNotEqual(key, get_schema_cache_key(SCHEMA_FILES[:1], PROP_FILE))
+        self.assertIsNone(get_schema_cache_key(SCHEMA_FILES + ['file_does_not_exist.yml'], PROP_FILE))
+        self.assertIsNone(get_schema_cache_key(SCHEMA_FILES, 'file_does_not_exist.yml'))
+
+        changed_file = os.path.join(self.folder, 'model.yml')
+        shutil.copy(SCHEMA_FILES[0], changed_file)
+        self.assertEqual(key, get_schema_cache_key([changed_file, SCHEMA_FILES[1]], PROP_FILE))
+        with open(changed_file, 'a') as model_file:
+            model_file.write('\n')
+        self.assertNotEqual(key, get_schema_cache_key([changed_file, SCHEMA_FILES[1]], PROP_FILE))
+
+    def test_load_schema(self):
+        schema = load_schema(SCHEMA_FILES, PROP_FILE, self.folder)
+        self.assertIsInstance(schema, ICDC_Schema)
+        self.assertEqual(1, len(self.cache_files()))
+
+        # Mark cached schema, so it can be told apart from a newly created one
+        cache_file = os.path.join(self.folder, self.cache_files()[0])
+        with open(cache_file, 'rb') as in_file:
+            cached_schema = pickle.load(in_file)
+        cached_schema.cached = True
+        with open(cache_file, 'wb') as out_file:
+            pickle.dump(cached_schema, out_file)
+        self.assertTrue(load_schema(SCHEMA_FILES, PROP_FILE, self.folder).cached)
+
+        # Broken cache falls back to parsing schema files
+        with open(cache_file, 'wb') as out_file:
+            out_file.write(b'broken')
+        schema = load_schema(SCHEMA_FILES, PROP_FILE, self.folder)
+        self.assertIsInstance(schema, ICDC_Schema)
+        self.assertFalse(hasattr(schema, 'cached'))
+
+    def test_load_schema_without_cache(self):
+        self.assertIsInstance(load_schema(SCHEMA_FILES, PROP_FILE), ICDC_Schema)
+        self.assertIsInstance(load_schema(SCHEMA_FILES, PROP_FILE, None), ICDC_Schema)
+        # Missing files bypass the cache and raise same errors as before
+        self.assertRaises(Exception, load_schema, SCHEMA_FILES, 'file_does_not_exist.yml', self.folder)
+        self.assertRaises(Exception, load_schema, ['file_does_not_exist.yml'], PROP_FILE, self.folder)
+        self.assertEqual([], self.cache_files())
+
+    def test_prune(self):
+        for i in range(12):
+            cache_file = os.path.join(self.folder, '{}.pkl'.format(i))
+            with open(cache_file, 'wb'):
+                pass
+            os.utime(cache_file, (i, i))
+        prune_schema_cache(self.folder, 10, get_logger('Test Schema'))
+        self.assertEqual(sorted('{}.pkl'.format(i) for i in range(2, 12)), sorted(self.cache_files()))
+
 
 if __name__ == '__main__':
     unittest.main()
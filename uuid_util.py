@@ -8,7 +8,9 @@ import argparse
 import csv
 import os
 
-from bento.common.utils import LOG_PREFIX, APP_NAME, get_logger, get_uuid
+from bento.common.utils import LOG_PREFIX, APP_NAME, get_logger
+from icdc_schema import generate_node_uuid
+from props import UUID5, UUID_ALGORITHMS
 
 if LOG_PREFIX not in os.environ:
     os.environ[LOG_PREFIX] = 'UUID_util'
@@ -24,7 +26,7 @@ def get_new_manifest_name(manifest):
     return os.path.join(folder, new_name)
 
 
-def process_file(file_obj, signature_column, uuid_column, domain, indexd_mode):
+def process_file(file_obj, signature_column, uuid_column, domain, indexd_mode, uuid_algorithm=UUID5):
     file_name = file_obj.name
     log.info(f"Processing {file_name}")
     data = []
@@ -41,7 +43,7 @@ def process_file(file_obj, signature_column, uuid_column, domain, indexd_mode):
         current_uuid = obj.get(uuid_column)
         if indexd_mode:
             guid_prefix, current_uuid = current_uuid.split('/')
-        new_uuid = get_uuid(domain, 'file', signature)
+        new_uuid = generate_node_uuid(domain, 'file', signature, uuid_algorithm)
         if current_uuid != new_uuid:
             log.error(f"UUIDs don't match! current: {current_uuid}, new: {new_uuid}")
             failed += 1
@@ -88,6 +90,8 @@ def main():
                                                          'file_location, legacy files (before UBC01) should use '
                                                          'md5sum', default='file_location')
     parser.add_argument('-i', '--indexd-mode', help='IndexD Mode', action='store_true')
+    parser.add_argument('-a', '--uuid-algorithm', help='Algorithm used to generate UUIDs', choices=UUID_ALGORITHMS,
+                        default=UUID5)
 
     args = parser.parse_args()
 
@@ -103,13 +107,15 @@ def main():
     if args.indexd_mode:
         log.info('IndexD mode on, will process IndexD GUID properly')
     log.info(f'Domain name: {domain}')
+    log.info(f'UUID algorithm: {args.uuid_algorithm}')
     log.info(f'UUID column name: {uuid_column}, Signature column name: {signature_column}')
 
     total = 0
     succeeded = 0
     failed = 0
     for file_obj in args.manifests:
-        tot, suc, fai = process_file(file_obj, signature_column, uuid_column, domain, args.indexd_mode)
+        tot, suc, fai = process_file(file_obj, signature_column, uuid_column, domain, args.indexd_mode,
+                                     args.uuid_algorithm)
         total += tot
         succeeded += suc
         failed += fai